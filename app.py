@@ -1,42 +1,52 @@
 import streamlit as st
-from langchain_google_genai import GoogleGenerativeAI
-from langchain_core.prompts import PromptTemplate
 from dotenv import load_dotenv
 import os
-from langchain_core.output_parsers import StrOutputParser
-import subprocess
-import tempfile
-import base64
-import uuid
 from pathlib import Path
 import time
 from datetime import datetime
 import json
-import reportlab
+import re
 import sys
+import io
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import islice
+import hashlib
+import shelve
+import dbm
+import threading
+import queue
+import pickle
+import subprocess
 
 # Load environment variables
 load_dotenv()
 
-# Initialize the model
-@st.cache_resource
-def load_model():
-    return GoogleGenerativeAI(
-        model='gemini-2.5-flash',
-        temperature=st.session_state.get('temperature', 0.5),
-        google_api_key=os.getenv('GOOGLE_API_KEY')
-    )
+MODEL_NAME = 'gemini-2.5-flash'
+CACHE_DIR = Path.home() / '.pdfgen_cache'
+RESPONSE_DB = CACHE_DIR / 'responses.db'
+SEMANTIC_EMBEDDINGS = CACHE_DIR / 'semantic_embeddings.npy'
+SEMANTIC_ENTRIES = CACHE_DIR / 'semantic_entries.pkl'
+SEMANTIC_THRESHOLD = 0.92
+SEMANTIC_MAX_ENTRIES = 500
+EMBEDDING_DIM = 384
+WORKER_SCRIPT = Path(__file__).with_name('worker.py')
 
-def generate_pdf_code(prompt, style_preference="", include_examples=True):
-    """Generate Python code for PDF creation using LLM"""
-    
-    style_instructions = ""
-    if style_preference:
-        style_instructions = f" Style preferences: {style_preference}"
-    
-    examples = ""
-    if include_examples:
-        examples = """
+PDF_CODE_TEMPLATE = """You are a highly skilled Python developer specialized in generating PDF files using reportlab.
+        Your task is to write complete and correct Python code that generates a beautiful PDF based on the user's instructions.
+
+        Requirements:
+        {examples}
+        {style_instructions}
+
+        User Prompt: {prompt}
+
+        Return only the python code without any explanations or markdown formatting.
+        Make sure the code is complete and can run independently.
+        Save the PDF in the current working directory and print its filename on the last line of stdout as PDF_PATH=<path>."""
+
+_EXAMPLES_BLOCK = """
         Important: Use reportlab for PDF generation. Follow these guidelines:
         - Always use Canvas from reportlab.pdfgen
         - Set page size to A4 (595.27, 841.89)
@@ -45,66 +55,475 @@ def generate_pdf_code(prompt, style_preference="", include_examples=True):
         - Save with a unique filename using timestamp
         - Use professional fonts and colors
         """
-    
-    template = PromptTemplate(
-        template="""You are a highly skilled Python developer specialized in generating PDF files using reportlab.
-        Your task is to write complete and correct Python code that generates a beautiful PDF based on the user's instructions.
 
-        Requirements:
-        {examples}
-        {style_instructions}
+# Markdown code fences the model sometimes wraps its answer in
+_FENCE_RE = re.compile(r"^[ \t]*```(?:python)?[ \t]*$\n?", re.MULTILINE)
+# Marker line the generated code prints with the PDF it wrote
+_PDF_PATH_RE = re.compile(r"^PDF_PATH=(.+)$", re.MULTILINE)
 
-        User Prompt: {prompt}
+@st.cache_resource
+def warm_pdf_imports():
+    """Import reportlab and Pillow in the background, once per process"""
+    def _warm():
+        try:
+            import reportlab.pdfgen.canvas
+            import reportlab.lib.pagesizes
+            import PIL.Image
+        except ImportError:
+            pass
+    
+    thread = threading.Thread(target=_warm, daemon=True)
+    thread.start()
+    return thread
 
-        Return only the python code without any explanations or markdown formatting.
-        Make sure the code is complete and can run independently.""",
+# Initialize the model (one instance per temperature)
+@st.cache_resource
+def load_model(temperature=0.5):
+    from langchain_google_genai import GoogleGenerativeAI
+    return GoogleGenerativeAI(
+        model=MODEL_NAME,
+        temperature=temperature,
+        google_api_key=os.getenv('GOOGLE_API_KEY')
     )
+
+@st.cache_resource
+def get_response_db_lock():
+    """Lock guarding the on-disk response cache across sessions"""
+    return threading.Lock()
+
+def make_cache_key(prompt, style_preference, include_examples, temperature):
+    """Build a stable cache key for an LLM request"""
+    payload = json.dumps({
+        "p": prompt,
+        "s": style_preference,
+        "e": include_examples,
+        "t": round(temperature, 2),
+        "m": MODEL_NAME
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+@st.cache_resource
+def load_embedder():
+    """Sentence embedding model, or None if it can't be loaded in this process"""
+    try:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer('all-MiniLM-L6-v2')
+    except Exception:
+        # Cached as None so an offline process doesn't retry the download per request
+        return None
+
+@st.cache_resource
+def load_semantic_cache():
+    """Load stored prompt embeddings and their (code, prompt, settings) entries"""
+    import numpy as np
+    cache = {
+        'lock': threading.Lock(),
+        'embeddings': np.empty((0, EMBEDDING_DIM), dtype=np.float32),
+        'entries': []
+    }
+    if SEMANTIC_EMBEDDINGS.exists() and SEMANTIC_ENTRIES.exists():
+        try:
+            embeddings = np.load(SEMANTIC_EMBEDDINGS)
+            with open(SEMANTIC_ENTRIES, 'rb') as f:
+                entries = pickle.load(f)
+            if len(embeddings) == len(entries):
+                cache['embeddings'] = embeddings.astype(np.float32)
+                cache['entries'] = entries
+        except Exception:
+            pass
+    return cache
+
+def _save_semantic_cache(cache):
+    import numpy as np
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    np.save(SEMANTIC_EMBEDDINGS, cache['embeddings'])
+    with open(SEMANTIC_ENTRIES, 'wb') as f:
+        pickle.dump(cache['entries'], f)
+
+def make_settings_key(style_preference, include_examples, temperature):
+    """Settings a semantic match must share with the cached entry"""
+    return make_cache_key("", style_preference, include_examples, temperature)
+
+def semantic_lookup(query, settings_key):
+    """Return (code, matched prompt) for a near-duplicate prompt, or None"""
+    import numpy as np
+    cache = load_semantic_cache()
+    with cache['lock']:
+        if not cache['entries']:
+            return None
+        sims = (cache['embeddings'] @ query.T).ravel()
+        # Only compare against prompts generated with the same settings
+        mask = np.fromiter((entry[2] == settings_key for entry in cache['entries']),
+                           dtype=bool, count=len(cache['entries']))
+        sims[~mask] = -1.0
+        best = int(sims.argmax())
+        if sims[best] < SEMANTIC_THRESHOLD:
+            return None
+        
+        # Move the hit to the most-recently-used end
+        entry = cache['entries'].pop(best)
+        cache['entries'].append(entry)
+        order = np.r_[np.arange(best), np.arange(best + 1, len(sims)), best]
+        cache['embeddings'] = cache['embeddings'][order]
+        try:
+            # Persist the new order so eviction stays LRU across restarts
+            _save_semantic_cache(cache)
+        except OSError:
+            pass
+        return entry[0], entry[1]
+
+def semantic_store(query, prompt, settings_key, code):
+    """Add a generated response to the semantic cache, evicting the LRU entry"""
+    if query is None:
+        return
+    import numpy as np
+    cache = load_semantic_cache()
+    with cache['lock']:
+        cache['embeddings'] = np.vstack([cache['embeddings'], query.astype(np.float32)])
+        cache['entries'].append((code, prompt, settings_key))
+        if len(cache['entries']) > SEMANTIC_MAX_ENTRIES:
+            cache['embeddings'] = cache['embeddings'][-SEMANTIC_MAX_ENTRIES:]
+            cache['entries'] = cache['entries'][-SEMANTIC_MAX_ENTRIES:]
+        _save_semantic_cache(cache)
+
+def semantic_discard(code):
+    """Remove every semantic cache entry that maps to the given code"""
+    cache = load_semantic_cache()
+    with cache['lock']:
+        keep = [i for i, entry in enumerate(cache['entries']) if entry[0] != code]
+        if len(keep) == len(cache['entries']):
+            return
+        cache['embeddings'] = cache['embeddings'][keep]
+        cache['entries'] = [cache['entries'][i] for i in keep]
+        _save_semantic_cache(cache)
+
+# Failures of the on-disk cache; it is best-effort, so these never fail a request
+_CACHE_ERRORS = (OSError, *dbm.error)
+
+@st.cache_resource
+def get_response_memo():
+    """In-memory response cache shared across sessions"""
+    return {}
+
+def lookup_cached_response(key, settings_key, prompt, reuse=True):
+    """Return (code, prompt embedding, matched prompt); code is None on a cache miss.
+    
+    With reuse=False the caches are not consulted; only the embedding is computed
+    so a fresh response can still be stored.
+    """
+    memo = get_response_memo()
+    if reuse and memo.get(key):
+        return memo[key], None, None
+    
+    if reuse:
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            with get_response_db_lock():
+                with shelve.open(str(RESPONSE_DB)) as db:
+                    if db.get(key):
+                        memo[key] = db[key]
+                        return memo[key], None, None
+        except _CACHE_ERRORS:
+            pass
+    
+    # Reuse the code of a semantically equivalent prompt if we have one
+    embedder = load_embedder()
+    if embedder is None:
+        return None, None, None
+    try:
+        query = embedder.encode([prompt], normalize_embeddings=True)
+        match = semantic_lookup(query, settings_key) if reuse else None
+    except Exception:
+        # The semantic layer is best-effort (e.g. model unavailable offline)
+        return None, None, None
+    if match is not None:
+        # Already in the semantic cache; no embedding to store again
+        return match[0], None, match[1]
+    return None, query, None
+
+def store_cached_response(key, code):
+    """Save generated code in the in-memory and on-disk caches"""
+    get_response_memo()[key] = code
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with get_response_db_lock():
+            with shelve.open(str(RESPONSE_DB)) as db:
+                db[key] = code
+    except _CACHE_ERRORS:
+        pass
+
+def remember_response(response):
+    """Cache generated code once it has produced a PDF"""
+    if not response:
+        return
+    # Code borrowed from a similar prompt stays a semantic hit, so the user is
+    # told about it again instead of it turning into a silent exact match
+    if not response.get('matched_prompt'):
+        store_cached_response(response['key'], response['code'])
+    try:
+        semantic_store(response.get('query'), response.get('prompt'),
+                       response.get('settings_key'), response['code'])
+    except Exception:
+        pass
+
+def forget_response(response):
+    """Drop generated code that failed to produce a PDF from the caches"""
+    if not response:
+        return
+    get_response_memo().pop(response['key'], None)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with get_response_db_lock():
+            with shelve.open(str(RESPONSE_DB)) as db:
+                if response['key'] in db:
+                    del db[response['key']]
+    except _CACHE_ERRORS:
+        pass
+    
+    # Rewording the prompt must not bring the same broken code back
+    try:
+        semantic_discard(response['code'])
+    except Exception:
+        pass
+
+def stream_completion(model, prompt_text):
+    """Stream the model output, showing the code as it is generated"""
+    placeholder = st.empty()
+    chunks = []
+    for tok in model.stream(prompt_text):
+        chunks.append(tok)
+        if len(chunks) % 8 == 0:
+            placeholder.code("".join(chunks), language="python")
+    placeholder.empty()
+    return "".join(chunks)
+
+def clear_response_cache():
+    """Drop the in-memory, on-disk and semantic response caches"""
+    get_response_memo().clear()
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with get_response_db_lock():
+            with shelve.open(str(RESPONSE_DB)) as db:
+                db.clear()
+    except _CACHE_ERRORS:
+        pass
+    
+    cache = load_semantic_cache()
+    with cache['lock']:
+        cache['embeddings'] = cache['embeddings'][:0]
+        cache['entries'] = []
+        _save_semantic_cache(cache)
+
+def request_fresh_generation():
+    """Button callback: regenerate the current prompt without reusing cached code"""
+    st.session_state.regenerate_fresh = True
+
+def generate_pdf_code(prompt, style_preference="", include_examples=True, reuse_cached=True):
+    """Generate Python code for PDF creation using LLM"""
+    # Cached only once main() knows the code produced a PDF
+    st.session_state.pending_response = None
     
-    parser = StrOutputParser()
-    model = load_model()
-    chain = template | model | parser
+    temperature = st.session_state.get('temperature', 0.5)
+    key = make_cache_key(prompt, style_preference, include_examples, temperature)
+    settings_key = make_settings_key(style_preference, include_examples, temperature)
     
     try:
-        tempCode = str(chain.invoke({
-            'prompt': prompt,
-            'style_instructions': style_instructions,
-            'examples': examples
-        }))
+        code, query, matched_prompt = lookup_cached_response(key, settings_key, prompt,
+                                                             reuse=reuse_cached)
+        if code:
+            st.session_state.pending_response = {
+                'key': key,
+                'code': code,
+                'matched_prompt': matched_prompt
+            }
+            return code
+        
+        rendered = PDF_CODE_TEMPLATE.format(
+            examples=_EXAMPLES_BLOCK if include_examples else "",
+            style_instructions=f" Style preferences: {style_preference}" if style_preference else "",
+            prompt=prompt
+        )
+        tempCode = stream_completion(load_model(temperature), rendered)
         # Clean the code
-        tempCode = tempCode.replace("```python", "").replace("```", "").strip()
+        tempCode = _FENCE_RE.sub("", tempCode).strip()
+        
+        if tempCode:
+            st.session_state.pending_response = {
+                'key': key,
+                'code': tempCode,
+                'prompt': prompt,
+                'settings_key': settings_key,
+                'query': query
+            }
         return tempCode
     except Exception as e:
         st.error(f"Error generating code: {str(e)}")
         return None
 
-def create_pdf_from_code(code):
-    """Execute the generated code to create PDF"""
+class _ThreadLocalStream:
+    """Stream proxy that writes to the current thread's buffer, if any, else the real stream"""
+    def __init__(self, real, local, name):
+        self._real = real
+        self._local = local
+        self._name = name
+    
+    def _target(self):
+        buffer = getattr(self._local, self._name, None)
+        return self._real if buffer is None else buffer
+    
+    def write(self, text):
+        return self._target().write(text)
+    
+    def flush(self):
+        return self._target().flush()
+    
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+@st.cache_resource(show_spinner=False)
+def install_output_capture():
+    """Route sys.stdout/stderr through per-thread buffers, once per process"""
+    local = threading.local()
+    sys.stdout = _ThreadLocalStream(sys.stdout, local, 'stdout')
+    sys.stderr = _ThreadLocalStream(sys.stderr, local, 'stderr')
+    return local
+
+@st.cache_resource
+def get_in_process_runner():
+    """Lock serializing in-process runs, plus any run that outlived its timeout"""
+    return {'lock': threading.Lock(), 'stuck': None}
+
+def _exec_generated_code(code_obj, outcome, capture, run_lock):
+    """Run compiled generated code, capturing its output into outcome"""
+    capture.stdout, capture.stderr = io.StringIO(), io.StringIO()
     try:
-        # Create a temporary file with unique name
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
-            f.write(code)
-            temp_file_path = f.name
-        
-        # Execute the code with timeout
-        result = subprocess.run(
-            [sys.executable, temp_file_path],
-            capture_output=True,
-            text=True,
-            timeout=60
+        exec(code_obj, {"__name__": "__main__", "__builtins__": __builtins__})
+        outcome['returncode'] = 0
+    except SystemExit as e:
+        if isinstance(e.code, int) or e.code is None:
+            outcome['returncode'] = e.code or 0
+        else:
+            # Like the interpreter, sys.exit("message") prints the message and exits with 1
+            print(e.code, file=sys.stderr)
+            outcome['returncode'] = 1
+    except BaseException:
+        traceback.print_exc()
+        outcome['returncode'] = 1
+    finally:
+        outcome['stdout'] = capture.stdout.getvalue()
+        outcome['stderr'] = capture.stderr.getvalue()
+        capture.stdout = capture.stderr = None
+        # Released here rather than by the caller so a timed-out run keeps the lock
+        run_lock.release()
+
+def run_code_in_process(code, timeout=60):
+    """Execute generated code in this interpreter, mirroring subprocess.run's result"""
+    try:
+        code_obj = compile(code, "<generated>", "exec")
+    except SyntaxError:
+        return subprocess.CompletedProcess(["<generated>"], 1, "", traceback.format_exc())
+    
+    runner = get_in_process_runner()
+    stuck = runner['stuck']
+    if stuck is not None and stuck.is_alive():
+        # An earlier run is still stuck in this process; isolate this one in the worker
+        return run_code_in_worker(code, timeout)
+    
+    run_lock = runner['lock']
+    if not run_lock.acquire(timeout=timeout):
+        return run_code_in_worker(code, timeout)
+    
+    outcome = {}
+    worker = threading.Thread(target=_exec_generated_code,
+                              args=(code_obj, outcome, install_output_capture(), run_lock),
+                              daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        # Threads can't be killed, so say so instead of reporting a cancelled run
+        runner['stuck'] = worker
+        return subprocess.CompletedProcess(
+            ["<generated>"], 1, "",
+            f"PDF generation did not finish within {timeout} seconds. The generated code is "
+            "still running in the background; further runs will use the sandbox worker until it ends."
         )
+    
+    return subprocess.CompletedProcess(
+        ["<generated>"], outcome['returncode'], outcome['stdout'], outcome['stderr']
+    )
+
+@st.cache_resource
+def get_code_worker():
+    """Persistent worker process slot, shared across sessions"""
+    return {'lock': threading.Lock(), 'proc': None}
+
+def _start_code_worker():
+    return subprocess.Popen(
+        [sys.executable, "-u", str(WORKER_SCRIPT)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE
+    )
+
+def run_code_in_worker(code, timeout=60):
+    """Execute generated code in the long-lived worker process"""
+    worker = get_code_worker()
+    with worker['lock']:
+        proc = worker['proc']
+        if proc is None or proc.poll() is not None:
+            proc = worker['proc'] = _start_code_worker()
+        
+        payload = code.encode('utf-8')
+        try:
+            proc.stdin.write(b"%d\n" % len(payload) + payload)
+            proc.stdin.flush()
+        except OSError:
+            worker['proc'] = None
+            raise
         
-        # Clean up the temporary Python file
-        os.unlink(temp_file_path)
+        # Read on a helper thread; selectors can't wait on pipes on Windows
+        replies = queue.Queue()
+        threading.Thread(target=lambda: replies.put(proc.stdout.readline()), daemon=True).start()
+        try:
+            line = replies.get(timeout=timeout)
+        except queue.Empty:
+            # The job is stuck; kill the worker so the next run gets a fresh one
+            proc.kill()
+            proc.wait()
+            worker['proc'] = None
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        
+        if not line:
+            worker['proc'] = None
+            return subprocess.CompletedProcess(proc.args, proc.wait(), "", "Worker process exited unexpectedly")
+        
+        try:
+            reply = json.loads(line)
+        except ValueError:
+            # The reply stream is out of sync; start over with a fresh worker
+            proc.kill()
+            proc.wait()
+            worker['proc'] = None
+            return subprocess.CompletedProcess(proc.args, 1, "", "Worker process sent an invalid reply")
+    
+    return subprocess.CompletedProcess(proc.args, reply['returncode'], reply['stdout'], reply['stderr'])
+
+def create_pdf_from_code(code, sandbox=False):
+    """Execute the generated code to create PDF"""
+    try:
+        if sandbox:
+            result = run_code_in_worker(code)
+        else:
+            result = run_code_in_process(code)
         
         if result.returncode != 0:
-            error_msg = result.stderr
+            error_msg = result.stderr or f"Generated code exited with status {result.returncode}"
             # Try to provide more helpful error messages
             if "ModuleNotFoundError" in error_msg:
                 error_msg += "\n\n💡 Tip: The code requires additional libraries. Please install them using: pip install reportlab Pillow"
             st.error(f"Error executing code: {error_msg}")
             return None, error_msg
             
-        return result, None
+        return parse_pdf_path(result.stdout), None
     except subprocess.TimeoutExpired:
         error_msg = "PDF generation timed out. The code might be stuck in an infinite loop."
         st.error(error_msg)
@@ -114,66 +533,143 @@ def create_pdf_from_code(code):
         st.error(error_msg)
         return None, error_msg
 
+def parse_pdf_path(stdout):
+    """Return the PDF path reported by the generated code, if it is usable"""
+    matches = _PDF_PATH_RE.findall(stdout or "")
+    if not matches:
+        return None
+    pdf_path = Path(matches[-1].strip()).resolve()
+    # Only accept PDFs in the working directory, where cleanup_old_pdfs manages them
+    if (pdf_path.suffix.lower() == '.pdf' and pdf_path.is_file()
+            and pdf_path.parent == Path.cwd().resolve()):
+        return pdf_path
+    return None
+
 def find_pdf_files(directory='.'):
     """Find PDF files in the current directory"""
-    pdf_files = list(Path(directory).glob('*.pdf'))
+    entries = []
+    with os.scandir(directory) as it:
+        for e in it:
+            if not (e.is_file() and e.name.endswith('.pdf')):
+                continue
+            try:
+                entries.append((e.name, e.stat().st_mtime))
+            except FileNotFoundError:
+                # Removed by a concurrent cleanup after the listing
+                continue
     # Sort by modification time, newest first
-    pdf_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-    return pdf_files
+    entries.sort(key=lambda t: t[1], reverse=True)
+    return [Path(directory) / name for name, _ in entries]
 
-def get_pdf_download_link(pdf_path, filename):
-    """Generate a download link for the PDF file"""
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
-    
-    b64_pdf = base64.b64encode(pdf_bytes).decode()
-    href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="{filename}" style="\
-            background: linear-gradient(45deg, #4CAF50, #45a049); \
-            color: white; \
-            padding: 14px 20px; \
-            text-align: center; \
-            text-decoration: none; \
-            display: inline-block; \
-            border-radius: 8px; \
-            font-size: 16px; \
-            font-weight: bold; \
-            margin: 10px 0; \
-            border: none; \
-            cursor: pointer; \
-            transition: all 0.3s ease;">\
-            📥 Download PDF</a>'
-    return href
+@st.cache_resource
+def get_io_executor():
+    """Thread pool for file housekeeping off the request path"""
+    return ThreadPoolExecutor(max_workers=2)
+
+def cleanup_old_pdfs(keep=3, directory='.'):
+    """Delete all but the newest PDFs, ignoring ones already gone or locked"""
+    for path in find_pdf_files(directory)[keep:]:
+        try:
+            path.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+_DANGEROUS_PATTERNS = [
+    "os.system", "subprocess.call", "eval(", "exec(", "__import__",
+    "open(", "shutil.rmtree", "rm -", "del ", "import os"
+]
+# Lookahead so overlapping matches (e.g. "import os.system") are all reported
+_DANGER_RE = re.compile('(?=(' + '|'.join(map(re.escape, _DANGEROUS_PATTERNS)) + '))')
 
 def validate_code_safety(code):
     """Basic safety check for generated code"""
-    dangerous_patterns = [
-        "os.system", "subprocess.call", "eval(", "exec(", "__import__",
-        "open(", "shutil.rmtree", "rm -", "del ", "import os"
-    ]
-    
-    warnings = []
-    for pattern in dangerous_patterns:
-        if pattern in code:
-            warnings.append(f"Potential security concern: {pattern}")
-    
-    return warnings
+    found = {m.group(1) for m in _DANGER_RE.finditer(code)}
+    # One warning per pattern, in the order the patterns are listed
+    return [f"Potential security concern: {pattern}"
+            for pattern in _DANGEROUS_PATTERNS if pattern in found]
 
-def save_to_history(prompt, code, success, filename=None):
+def save_to_history(prompt, code, success, filename=None, timestamp=None):
     """Save generation attempt to history"""
     if 'history' not in st.session_state:
-        st.session_state.history = []
+        # Keep only last 10 entries
+        st.session_state.history = deque(maxlen=10)
     
     history_entry = {
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': (timestamp or datetime.now()).isoformat(),
         'prompt': prompt,
         'code': code,
         'success': success,
         'filename': filename
     }
     
-    st.session_state.history.insert(0, history_entry)
-    # Keep only last 10 entries
-    st.session_state.history = st.session_state.history[:10]
+    st.session_state.history.appendleft(history_entry)
+
+_CSS = """
+    <style>
+    .main-header {
+        font-size: 3rem;
+        color: #1f77b4;
+        text-align: center;
+        margin-bottom: 2rem;
+        background: linear-gradient(45deg, #1f77b4, #ff7f0e);
+        -webkit-background-clip: text;
+        -webkit-text-fill-color: transparent;
+        font-weight: bold;
+    }
+    .feature-card {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        padding: 20px;
+        border-radius: 15px;
+        color: white;
+        margin: 10px 0;
+    }
+    .feature-card h4, .feature-card ul {
+        color: white;
+    }
+    .footer-note {
+        text-align: center;
+        color: #666;
+    }
+    .download-section {
+        text-align: center;
+        padding: 30px;
+        background: linear-gradient(135deg, #e8f4fd 0%, #d1e7ff 100%);
+        border-radius: 15px;
+        margin: 20px 0;
+        border: 2px dashed #1f77b4;
+    }
+    .success-message {
+        padding: 15px;
+        background-color: #d4edda;
+        border: 1px solid #c3e6cb;
+        border-radius: 10px;
+        color: #155724;
+        margin: 10px 0;
+    }
+    .stDownloadButton button {
+        background: linear-gradient(45deg, #4CAF50, #45a049);
+        color: white;
+        font-size: 16px;
+        font-weight: bold;
+        border: none;
+        border-radius: 8px;
+        transition: all 0.3s ease;
+    }
+    .stProgress > div > div > div > div {
+        background: linear-gradient(45deg, #1f77b4, #ff7f0e);
+    }
+    </style>
+"""
+
+_EXAMPLE_PROMPTS = {
+    "Professional Resume": "Create a modern professional resume with sections for education, work experience, skills, and contact information. Use a clean layout with proper spacing.",
+    "Business Invoice": "Generate a professional invoice template with company header, itemized products/services, subtotal, tax, and total amount. Include payment terms and due date.",
+    "Project Report": "Create a comprehensive project report with cover page, table of contents, executive summary, methodology, results, and conclusion sections.",
+    "Event Certificate": "Design an elegant certificate template with decorative border, centered title, recipient name, description, and signature lines.",
+    "Marketing Brochure": "Generate a tri-fold brochure with attractive headings, bullet points, and placeholders for images. Use a modern color scheme."
+}
+
+_STYLE_OPTIONS = ["Professional", "Modern", "Minimal", "Elegant", "Creative", "Custom"]
 
 def main():
     st.set_page_config(
@@ -184,46 +680,10 @@ def main():
     )
     
     # Custom CSS
-    st.markdown("""
-        <style>
-        .main-header {
-            font-size: 3rem;
-            color: #1f77b4;
-            text-align: center;
-            margin-bottom: 2rem;
-            background: linear-gradient(45deg, #1f77b4, #ff7f0e);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-            font-weight: bold;
-        }
-        .feature-card {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            padding: 20px;
-            border-radius: 15px;
-            color: white;
-            margin: 10px 0;
-        }
-        .download-section {
-            text-align: center;
-            padding: 30px;
-            background: linear-gradient(135deg, #e8f4fd 0%, #d1e7ff 100%);
-            border-radius: 15px;
-            margin: 20px 0;
-            border: 2px dashed #1f77b4;
-        }
-        .success-message {
-            padding: 15px;
-            background-color: #d4edda;
-            border: 1px solid #c3e6cb;
-            border-radius: 10px;
-            color: #155724;
-            margin: 10px 0;
-        }
-        .stProgress > div > div > div > div {
-            background: linear-gradient(45deg, #1f77b4, #ff7f0e);
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(_CSS, unsafe_allow_html=True)
+    
+    # Load the PDF libraries while the user is still typing
+    warm_pdf_imports()
     
     # Initialize session state
     if 'generated_code' not in st.session_state:
@@ -248,7 +708,7 @@ def main():
         st.subheader("Style Preferences")
         style_preference = st.selectbox(
             "Document Style",
-            ["Professional", "Modern", "Minimal", "Elegant", "Creative", "Custom"]
+            _STYLE_OPTIONS
         )
         
         if style_preference == "Custom":
@@ -260,18 +720,15 @@ def main():
             include_examples = st.checkbox("Include coding guidelines", value=True)
             auto_download = st.checkbox("Auto-download PDF", value=False)
             show_debug = st.checkbox("Show debug information", value=False)
+            sandbox_mode = st.checkbox("Sandbox mode", value=False,
+                                       help="Run generated code in a separate worker process")
+            if st.button("🗑️ Clear cache", use_container_width=True):
+                clear_response_cache()
+                st.success("Response cache cleared")
         
         # Examples section
         st.subheader("📚 Quick Examples")
-        examples = {
-            "Professional Resume": "Create a modern professional resume with sections for education, work experience, skills, and contact information. Use a clean layout with proper spacing.",
-            "Business Invoice": "Generate a professional invoice template with company header, itemized products/services, subtotal, tax, and total amount. Include payment terms and due date.",
-            "Project Report": "Create a comprehensive project report with cover page, table of contents, executive summary, methodology, results, and conclusion sections.",
-            "Event Certificate": "Design an elegant certificate template with decorative border, centered title, recipient name, description, and signature lines.",
-            "Marketing Brochure": "Generate a tri-fold brochure with attractive headings, bullet points, and placeholders for images. Use a modern color scheme."
-        }
-        
-        for name, example in examples.items():
+        for name, example in _EXAMPLE_PROMPTS.items():
             if st.button(f"📄 {name}", key=name):
                 st.session_state.prompt_text = example
                 st.rerun()
@@ -279,7 +736,7 @@ def main():
         # History section
         if 'history' in st.session_state and st.session_state.history:
             st.subheader("📋 Generation History")
-            for i, entry in enumerate(st.session_state.history[:5]):
+            for i, entry in enumerate(islice(st.session_state.history, 5)):
                 with st.expander(f"{entry['timestamp'][:16]} - {entry['prompt'][:50]}..."):
                     st.write(f"Status: {'✅ Success' if entry['success'] else '❌ Failed'}")
                     if st.button(f"Retry #{i+1}", key=f"retry_{i}"):
@@ -326,9 +783,9 @@ def main():
         st.subheader("💡 Tips & Best Practices")
         
         st.markdown("""
-        <div style='background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; border-radius: 15px; color: white;'>
-        <h4 style='color: white;'>🎯 For Best Results:</h4>
-        <ul style='color: white;'>
+        <div class="feature-card">
+        <h4>🎯 For Best Results:</h4>
+        <ul>
         <li><b>Be specific</b> about content structure</li>
         <li><b>Mention</b> required sections (headers, tables, lists)</li>
         <li><b>Specify</b> color schemes and fonts</li>
@@ -349,7 +806,9 @@ def main():
         """)
     
     # Processing
-    if generate_btn and prompt:
+    # Set by the "Generate fresh code" button on a semantic cache hit
+    regenerate_fresh = st.session_state.pop('regenerate_fresh', False)
+    if (generate_btn or regenerate_fresh) and prompt:
         # Progress tracking
         progress_bar = st.progress(0)
         status_text = st.empty()
@@ -358,7 +817,8 @@ def main():
         status_text.text("🤖 Generating PDF code...")
         progress_bar.progress(25)
         
-        code = generate_pdf_code(prompt, style_preference, include_examples)
+        code = generate_pdf_code(prompt, style_preference, include_examples,
+                                 reuse_cached=not regenerate_fresh)
         
         if code:
             # Safety check
@@ -373,53 +833,56 @@ def main():
             with st.expander("🔍 View Generated Code", expanded=show_debug):
                 st.code(code, language='python')
             
+            # Code reused from a similar prompt may carry that prompt's details
+            matched_prompt = (st.session_state.pending_response or {}).get('matched_prompt')
+            if matched_prompt:
+                st.info(f"♻️ Reusing code generated for a similar prompt: \"{matched_prompt}\"")
+                st.button("🔁 Generate fresh code instead", on_click=request_fresh_generation)
+            
             status_text.text("✅ Code generated successfully! Creating PDF...")
             progress_bar.progress(50)
             
             # Step 2: Create PDF
             with st.spinner("📄 Generating PDF document..."):
-                result, error = create_pdf_from_code(code)
+                pdf_file, error = create_pdf_from_code(code, sandbox_mode)
                 
-                if result:
+                if not error:
                     progress_bar.progress(75)
                     
-                    # Find generated PDF files
-                    pdf_files = find_pdf_files()
+                    # Fall back to the newest PDF on disk if the code didn't report its path
+                    if pdf_file is None:
+                        pdf_files = find_pdf_files()
+                        pdf_file = pdf_files[0] if pdf_files else None
                     
-                    if pdf_files:
-                        pdf_file = pdf_files[0]
+                    if pdf_file:
+                        pdf_bytes = pdf_file.read_bytes()
                         progress_bar.progress(100)
                         status_text.text("✅ PDF generated successfully!")
                         
                         # Success section
                         st.balloons()
+                        now = datetime.now()
                         
                         # Save to history
-                        save_to_history(prompt, code, True, pdf_file.name)
+                        save_to_history(prompt, code, True, pdf_file.name, now)
+                        remember_response(st.session_state.pending_response)
                         
                         # Enhanced download section
                         st.markdown('<div class="download-section">', unsafe_allow_html=True)
                         st.markdown("### 🎉 Your PDF is Ready!")
                         
-                        col_d1, col_d2, col_d3 = st.columns(3)
+                        col_d1, col_d2 = st.columns(2)
                         
                         with col_d1:
-                            st.markdown(get_pdf_download_link(pdf_file, f"document_{uuid.uuid4().hex[:8]}.pdf"), unsafe_allow_html=True)
-                        
-                        with col_d2:
-                            # PDF preview (first page as image would be better, but simplified)
-                            with open(pdf_file, "rb") as f:
-                                pdf_bytes = f.read()
-                            
                             st.download_button(
                                 label="📥 Download PDF",
                                 data=pdf_bytes,
-                                file_name=f"generated_document_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+                                file_name=f"generated_document_{now.strftime('%Y%m%d_%H%M%S')}.pdf",
                                 mime="application/pdf",
                                 use_container_width=True
                             )
                         
-                        with col_d3:
+                        with col_d2:
                             if st.button("🔄 Generate Another", use_container_width=True):
                                 st.session_state.prompt_text = ""
                                 st.session_state.generated_code = None
@@ -428,23 +891,21 @@ def main():
                         st.markdown('</div>', unsafe_allow_html=True)
                         
                         # File info
-                        file_size = pdf_file.stat().st_size / 1024  # KB
-                        st.info(f"**File Info:** {pdf_file.name} | {file_size:.1f} KB | Generated at {datetime.now().strftime('%H:%M:%S')}")
+                        file_size = len(pdf_bytes) / 1024  # KB
+                        st.info(f"**File Info:** {pdf_file.name} | {file_size:.1f} KB | Generated at {now.strftime('%H:%M:%S')}")
                         
                         # Clean up old files (keep last 3)
-                        for old_pdf in pdf_files[3:]:
-                            try:
-                                old_pdf.unlink()
-                            except:
-                                pass
+                        get_io_executor().submit(cleanup_old_pdfs)
                     else:
                         status_text.text("❌ PDF generation failed")
                         save_to_history(prompt, code, False)
+                        forget_response(st.session_state.pending_response)
                         st.error("PDF file was not generated. Please try again with a more specific prompt.")
                 else:
                     progress_bar.progress(100)
                     status_text.text("❌ PDF creation failed")
                     save_to_history(prompt, code, False)
+                    forget_response(st.session_state.pending_response)
                     st.error("Failed to create PDF. Please try again with a different prompt.")
         else:
             progress_bar.progress(100)
@@ -459,7 +920,7 @@ def main():
     col_f1, col_f2, col_f3 = st.columns(3)
     with col_f2:
         st.markdown(
-            "<div style='text-align: center; color: #666;'>"
+            "<div class='footer-note'>"
             "Powered by Google Gemini AI & Streamlit<br>"
             "Generated PDFs are automatically cleaned up after download"
             "</div>",
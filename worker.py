@@ -0,0 +1,61 @@
+"""Long-lived worker that executes generated PDF code sent over stdin.
+
+The parent writes "<byte length>\n" followed by that many bytes of UTF-8
+source; the worker replies with one JSON line holding returncode, stdout
+and stderr.
+"""
+import os
+import sys
+import io
+import json
+import contextlib
+import traceback
+
+# Paid once per worker instead of once per generated document. If reportlab
+# is missing, the job's own import reports it through the reply instead.
+try:
+    import reportlab.pdfgen.canvas
+    import reportlab.lib.pagesizes
+except ImportError:
+    pass
+
+
+def run(code):
+    """Execute one job, capturing its output"""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    returncode = 0
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            exec(compile(code, "<generated>", "exec"), {"__name__": "__main__"})
+        except SystemExit as e:
+            if isinstance(e.code, int) or e.code is None:
+                returncode = e.code or 0
+            else:
+                # Like the interpreter, sys.exit("message") prints the message and exits with 1
+                print(e.code, file=sys.stderr)
+                returncode = 1
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+    return {'returncode': returncode, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+
+def main():
+    stdin = sys.stdin.buffer
+    # Replies go over a private copy of fd 1; fd 1 itself is pointed at stderr
+    # so output that bypasses sys.stdout (os.system, child processes, C code)
+    # can't end up in the reply stream
+    reply_fd = os.dup(1)
+    os.dup2(2, 1)
+    out = os.fdopen(reply_fd, 'w', encoding='utf-8')
+    while True:
+        header = stdin.readline()
+        if not header:
+            break
+        code = stdin.read(int(header)).decode('utf-8')
+        out.write(json.dumps(run(code)) + "\n")
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()